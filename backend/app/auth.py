@@ -1,13 +1,53 @@
-import random
-from fastapi import APIRouter, Depends, HTTPException, Response, Cookie
-from sqlmodel import Session, select
-from .db import get_session
+import hmac
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Cookie, Header
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .cache import UserCache, UserSnapshot
+from .db import get_async_session
+from .importer import aiter_lines, import_users, iter_rows
+from .mailer import cancel_pending, dispatcher, verification_email
+from .metrics import CallbackCounter
 from .models import User
-from .schemas import RegisterIn, LoginIn, VerifyCodeIn, UserOut
-from .security import hash_password, verify_password, create_access_token, create_refresh_token, decode_token
+from .ratelimit import (
+    LOGIN_GLOBAL, LOGIN_PER_EMAIL, LOGIN_PER_IP, RESEND_PER_EMAIL, RESEND_PER_IP, VERIFY_PER_EMAIL, VERIFY_PER_IP,
+    client_ip, limiter,
+)
+from .schemas import RegisterIn, LoginIn, VerifyCodeIn, ResendCodeIn, UserOut
+from .security import (
+    hash_password_async, verify_password_async, dummy_verify_password_async, create_access_token, create_refresh_token,
+    decode_token, generate_verification_code,
+)
 from .config import settings
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+CallbackCounter(
+    "user_cache_requests_total", "User snapshot cache lookups.",
+    lambda: {("hit",): user_cache.hits, ("miss",): user_cache.misses}, ("result",),
+)
+
+
+async def _user_by_id(session: AsyncSession, user_id: int) -> UserSnapshot | None:
+    snapshot = user_cache.get_by_id(user_id)
+    if snapshot is None:
+        user = await session.get(User, user_id)
+        if user:
+            snapshot = UserSnapshot.from_user(user)
+            user_cache.put(snapshot)
+    return snapshot
+
+
+async def _user_by_email(session: AsyncSession, email: str) -> UserSnapshot | None:
+    snapshot = user_cache.get_by_email(email)
+    if snapshot is None:
+        user = (await session.exec(select(User).where(User.email == email.lower()))).first()
+        if user:
+            snapshot = UserSnapshot.from_user(user)
+            user_cache.put(snapshot)
+    return snapshot
 
 
 def _set_refresh_cookie(response: Response, refresh_token: str):
@@ -23,32 +63,33 @@ def _set_refresh_cookie(response: Response, refresh_token: str):
 
 
 @router.post("/register", response_model=UserOut)
-def register(data: RegisterIn, session: Session = Depends(get_session)):
-    exists = session.exec(select(User).where((User.email == data.email) | (User.username == data.username))).first()
+async def register(data: RegisterIn, session: AsyncSession = Depends(get_async_session)):
+    exists = (await session.exec(select(User).where((User.email == data.email) | (User.username == data.username)))).first()
     if exists:
         raise HTTPException(status_code=400, detail="Email or username already exists")
 
-    code = f"{random.randint(0, 9999):04d}"  # 4-digit code
+    code = generate_verification_code()
     user = User(
         email=data.email.lower(),
         username=data.username,
-        hashed_password=hash_password(data.password),
+        hashed_password=await hash_password_async(data.password),
         is_verified=False,
         verification_code=code,
     )
     session.add(user)
-    session.commit()
-    session.refresh(user)
-
-    # NOTE: for now we "return" code in console (dev). In production: send email.
-    print(f"[DEV] Verification code for {user.email}: {code}")
+    session.add(verification_email(user.email, code))
+    await session.commit()
+    await session.refresh(user)
+    user_cache.put(UserSnapshot.from_user(user))
+    dispatcher.notify()
 
     return UserOut(id=user.id, email=user.email, username=user.username, is_verified=user.is_verified)
 
 
 @router.post("/verify", response_model=UserOut)
-def verify_email(data: VerifyCodeIn, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == data.email.lower())).first()
+async def verify_email(data: VerifyCodeIn, request: Request, session: AsyncSession = Depends(get_async_session)):
+    await limiter.check((VERIFY_PER_IP, client_ip(request)), (VERIFY_PER_EMAIL, data.email.lower()))
+    user = (await session.exec(select(User).where(User.email == data.email.lower()))).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.is_verified:
@@ -59,16 +100,45 @@ def verify_email(data: VerifyCodeIn, session: Session = Depends(get_session)):
     user.is_verified = True
     user.verification_code = None
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
+    user_cache.put(UserSnapshot.from_user(user))
 
     return UserOut(id=user.id, email=user.email, username=user.username, is_verified=user.is_verified)
 
 
+@router.post("/resend-code")
+async def resend_code(data: ResendCodeIn, request: Request, session: AsyncSession = Depends(get_async_session)):
+    email = data.email.lower()
+    await limiter.check((RESEND_PER_IP, client_ip(request)), (RESEND_PER_EMAIL, email))
+
+    # Same answer whether or not the account exists, so this cannot be used to probe emails.
+    user = (await session.exec(select(User).where(User.email == email))).first()
+    if user and not user.is_verified:
+        code = generate_verification_code()
+        user.verification_code = code
+        session.add(user)
+        # Older codes are invalid now; drop their queued emails in the same transaction.
+        await cancel_pending(session, user.email, "verification")
+        session.add(verification_email(user.email, code))
+        await session.commit()
+        await session.refresh(user)
+        user_cache.put(UserSnapshot.from_user(user))
+        dispatcher.notify()
+
+    return {"ok": True}
+
+
 @router.post("/login")
-def login(data: LoginIn, response: Response, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == data.email.lower())).first()
-    if not user or not verify_password(data.password, user.hashed_password):
+async def login(data: LoginIn, request: Request, response: Response, session: AsyncSession = Depends(get_async_session)):
+    await limiter.check((LOGIN_PER_IP, client_ip(request)), (LOGIN_PER_EMAIL, data.email.lower()), (LOGIN_GLOBAL, "all"))
+    user = await _user_by_email(session, data.email)
+    if user:
+        valid = await verify_password_async(data.password, user.hashed_password)
+    else:
+        # Unknown emails still pay for a bcrypt verify so response time does not reveal which accounts exist.
+        valid = await dummy_verify_password_async()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     access = create_access_token(str(user.id))
@@ -79,7 +149,7 @@ def login(data: LoginIn, response: Response, session: Session = Depends(get_sess
 
 
 @router.get("/me", response_model=UserOut)
-def me(authorization: str | None = None, session: Session = Depends(get_session)):
+async def me(authorization: str | None = None, session: AsyncSession = Depends(get_async_session)):
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Missing access token")
 
@@ -92,7 +162,7 @@ def me(authorization: str | None = None, session: Session = Depends(get_session)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid access token")
 
-    user = session.get(User, user_id)
+    user = await _user_by_id(session, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -100,7 +170,7 @@ def me(authorization: str | None = None, session: Session = Depends(get_session)
 
 
 @router.post("/refresh")
-def refresh(response: Response, refresh_token: str | None = Cookie(default=None), session: Session = Depends(get_session)):
+async def refresh(response: Response, refresh_token: str | None = Cookie(default=None), session: AsyncSession = Depends(get_async_session)):
     if not refresh_token:
         raise HTTPException(status_code=401, detail="Missing refresh token")
 
@@ -112,7 +182,7 @@ def refresh(response: Response, refresh_token: str | None = Cookie(default=None)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    user = session.get(User, user_id)
+    user = await _user_by_id(session, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -124,6 +194,37 @@ def refresh(response: Response, refresh_token: str | None = Cookie(default=None)
 
 
 @router.post("/logout")
-def logout(response: Response):
+async def logout(response: Response):
     response.delete_cookie(key="refresh_token", path="/api/auth/refresh")
     return {"ok": True}
+
+
+class _RequestBodyStreamingResponse(StreamingResponse):
+    """StreamingResponse for bodies produced while the request body is still being read.
+
+    The stock __call__ runs listen_for_disconnect next to the stream, and that listener
+    swallows the http.request messages request.stream() is waiting for. request.stream()
+    raises ClientDisconnect by itself, which ends the response here.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except ClientDisconnect:
+            return
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/import")
+async def bulk_import(request: Request, x_import_token: str | None = Header(default=None)):
+    if not settings.IMPORT_TOKEN or not x_import_token or not hmac.compare_digest(x_import_token.encode(), settings.IMPORT_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Bulk import is not allowed")
+    content_type = request.headers.get("content-type", "")
+    fmt = "csv" if content_type.startswith("text/csv") else "ndjson"
+
+    async def results():
+        async for result in import_users(iter_rows(aiter_lines(request.stream()), fmt)):
+            yield json.dumps(result) + "\n"
+
+    return _RequestBodyStreamingResponse(results(), media_type="application/x-ndjson")
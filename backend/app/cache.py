@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple
+
+
+class TTLCache:
+    """Size-bounded LRU map whose entries carry their own absolute expiry (epoch seconds)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[1] > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[0]
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, expires_at: float):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any | None:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class UserSnapshot(NamedTuple):
+    id: int
+    email: str
+    username: str
+    hashed_password: str
+    is_verified: bool
+    verification_code: str | None
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(user.id, user.email, user.username, user.hashed_password, user.is_verified, user.verification_code)
+
+
+class UserCache:
+    """Immutable user snapshots reachable by id and by lowercased email."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries = TTLCache(maxsize * 2)  # two keys per user
+
+    @property
+    def hits(self) -> int:
+        return self._entries.hits
+
+    @property
+    def misses(self) -> int:
+        return self._entries.misses
+
+    def get_by_id(self, user_id: int) -> UserSnapshot | None:
+        return self._entries.get(("id", user_id))
+
+    def get_by_email(self, email: str) -> UserSnapshot | None:
+        return self._entries.get(("email", email.lower()))
+
+    def put(self, snapshot: UserSnapshot):
+        expires_at = time.time() + self.ttl_seconds
+        self._entries.set(("id", snapshot.id), snapshot, expires_at)
+        self._entries.set(("email", snapshot.email.lower()), snapshot, expires_at)
+
+    def clear(self):
+        self._entries.clear()
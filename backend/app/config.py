@@ -3,14 +3,70 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./app.db"
+    DB_CREATE_ON_STARTUP: bool = True  # app.serve creates the schema once before forking workers
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_PRE_PING: bool = True  # server databases only
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
 
     JWT_SECRET: str = "change-me"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    TOKEN_CACHE_SIZE: int = 10_000  # verified token payloads kept in memory, 0 disables
+
+    USER_CACHE_SIZE: int = 10_000  # users kept in memory, 0 disables
+    USER_CACHE_TTL_SECONDS: int = 60  # per process: under app.serve, other workers can serve a stale user this long
+
+    WEB_WORKERS: int = 0  # app.serve worker count, 0 = one per CPU core
+
+    METRICS_DIR: str | None = None  # app.serve workers share /metrics snapshots here (a temp dir by default)
+    METRICS_FLUSH_SECONDS: float = 5
+    SERVER_TIMING_ENABLED: bool = False  # per-phase Server-Timing header; leaks account existence, keep off in production
 
     FRONTEND_ORIGIN: str = "http://localhost:3000"
     COOKIE_SECURE: bool = False  # True in production (https)
 
+    HASH_POOL: str = "thread"  # "thread" (bcrypt releases the GIL) or "process"
+    HASH_WORKERS: int = 0  # 0 = one per CPU core
+    HASH_QUEUE_SIZE: int = 64  # hashes allowed to wait for a worker before answering 503
+    HASH_RETRY_AFTER_SECONDS: int = 1
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (per process) or "redis" (shared by all workers)
+    REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_LOGIN_PER_IP: str = "20/60"  # attempts/seconds
+    RATE_LIMIT_LOGIN_PER_EMAIL: str = "5/60"
+    RATE_LIMIT_LOGIN_GLOBAL: str = "200/1"
+    RATE_LIMIT_VERIFY_PER_IP: str = "20/60"
+    RATE_LIMIT_VERIFY_PER_EMAIL: str = "5/900"  # 4-digit codes: keep guesses far below 10^4
+    RATE_LIMIT_RESEND_PER_IP: str = "10/60"
+    RATE_LIMIT_RESEND_PER_EMAIL: str = "3/900"
+    TRUST_PROXY_HEADERS: bool = False  # take the client IP from X-Forwarded-For
+    TRUSTED_PROXY_HOPS: int = 1  # proxies in front of the app that append to X-Forwarded-For
+
+    SMTP_HOST: str | None = None  # unset: emails are printed to the console (dev)
+    SMTP_PORT: int = 25
+    SMTP_USERNAME: str | None = None
+    SMTP_PASSWORD: str | None = None
+    SMTP_STARTTLS: bool = False
+    SMTP_FROM: str = "no-reply@localhost"
+    SMTP_TIMEOUT_SECONDS: int = 10
+    SMTP_POOL_SIZE: int = 2
+    OUTBOX_DISPATCHER_ENABLED: bool = True  # false when running `python -m app.mailer` separately
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_POLL_SECONDS: float = 2
+    OUTBOX_LEASE_SECONDS: int = 60
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_BACKOFF_SECONDS: int = 5
+    OUTBOX_BACKOFF_MAX_SECONDS: int = 900
+
+    IMPORT_TOKEN: str | None = None  # enables POST /api/auth/import when set
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_WORKERS: int = 0  # hashes imports keep in the shared hash pool at once; 0 = half its workers
+
     class Config:
         env_file = ".env"
 
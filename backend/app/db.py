@@ -1,8 +1,104 @@
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .config import settings
+from .metrics import DB_POOL_WAIT_SECONDS, DB_QUERY_SECONDS, record_phase
 
-connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(settings.DATABASE_URL, echo=False, connect_args=connect_args)
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _async_url(url: str) -> str:
+    u = make_url(url)
+    if u.drivername in _ASYNC_DRIVERS:
+        u = u.set(drivername=_ASYNC_DRIVERS[u.drivername])
+    return u.render_as_string(hide_password=False)
+
+
+class _TimedCheckout:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_POOL_WAIT_SECONDS.observe(elapsed)
+            record_phase("dbwait", elapsed)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_kwargs(url: str) -> dict:
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        if u.database in (None, "", ":memory:") or u.query.get("mode") == "memory":
+            return {"connect_args": {"check_same_thread": False}}
+        return {
+            "connect_args": {"check_same_thread": False},
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+        }
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    record_phase("db", elapsed)
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    # WAL lets readers proceed while a writer commits; NORMAL is durable across app crashes in WAL mode.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
+
+_pool_kwargs = _engine_kwargs(settings.DATABASE_URL)
+_queue_pooled = "pool_size" in _pool_kwargs
+engine = create_engine(
+    settings.DATABASE_URL, echo=False, **_pool_kwargs, **({"poolclass": TimedQueuePool} if _queue_pooled else {})
+)
+async_engine = create_async_engine(
+    _async_url(settings.DATABASE_URL), echo=False, **_pool_kwargs, **({"poolclass": TimedAsyncQueuePool} if _queue_pooled else {})
+)
+async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+for _sync_engine in (engine, async_engine.sync_engine):
+    event.listen(_sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(_sync_engine, "handle_error", _handle_error)
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
 
 
 def create_db_and_tables():
@@ -12,3 +108,8 @@ def create_db_and_tables():
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session():
+    async with async_session_factory() as session:
+        yield session
@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+import json
+import sys
+from .db import async_engine, create_db_and_tables
+from .importer import FORMATS, aiter_sync, import_users, iter_rows
+from .security import shutdown_hash_executor
+
+
+async def _run(path: str, fmt: str) -> dict:
+    counts: dict[str, int] = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        async for result in import_users(iter_rows(aiter_sync(f), fmt)):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            sys.stdout.write(json.dumps(result) + "\n")
+    await async_engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create users from an NDJSON or CSV file (email, username, password).")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    create_db_and_tables()
+    try:
+        counts = asyncio.run(_run(args.path, fmt))
+    finally:
+        shutdown_hash_executor()
+    print(json.dumps(counts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
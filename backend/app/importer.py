@@ -0,0 +1,166 @@
+import asyncio
+import csv
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from .config import settings
+from .db import async_session_factory
+from .mailer import dispatcher, verification_email_row
+from .models import OutboxEmail, User
+from .schemas import RegisterIn
+from .security import generate_verification_code, hash_password_bulk
+
+FORMATS = ("ndjson", "csv")
+
+_DIALECT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}  # both support ON CONFLICT ... RETURNING
+
+
+_hash_slots: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+
+
+def _import_hash_slots() -> asyncio.Semaphore:
+    # Imports hash in the shared login pool, at most IMPORT_WORKERS at a time across all imports
+    # in this process, so a large file cannot queue ahead of every /login.
+    global _hash_slots
+    loop = asyncio.get_running_loop()
+    if _hash_slots is None or _hash_slots[0] is not loop:
+        workers = settings.IMPORT_WORKERS or max(1, (settings.HASH_WORKERS or os.cpu_count() or 1) // 2)
+        _hash_slots = (loop, asyncio.Semaphore(workers))
+    return _hash_slots[1]
+
+
+async def _hash(password: str) -> str:
+    async with _import_hash_slots():
+        return await hash_password_bulk(password)
+
+
+async def aiter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+async def aiter_sync(lines: Iterable[str]) -> AsyncIterator[str]:
+    for line in lines:
+        yield line
+
+
+async def iter_rows(lines: AsyncIterable[str], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    # CSV is parsed line by line (first line is the header), so quoted fields cannot span lines.
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                raw = dict(zip(header, values))
+            else:
+                raw = json.loads(line)
+                if not isinstance(raw, dict):
+                    raise ValueError("expected a JSON object")
+        except (ValueError, csv.Error) as e:
+            yield line_no, None, str(e)
+            continue
+        yield line_no, raw, None
+
+
+async def _import_batch(batch: list[tuple[int, dict | None, str | None]]) -> list[dict]:
+    results: dict[int, dict] = {}
+    valid: list[tuple[int, RegisterIn]] = []
+    seen_emails: set[str] = set()
+    seen_usernames: set[str] = set()
+    for line_no, raw, error in batch:
+        if raw is None:
+            results[line_no] = {"row": line_no, "status": "invalid", "errors": [error]}
+            continue
+        try:
+            data = RegisterIn(**raw)
+        except ValidationError as e:
+            results[line_no] = {"row": line_no, "status": "invalid", "errors": e.errors(include_url=False, include_context=False, include_input=False)}
+            continue
+        data.email = data.email.lower()
+        if data.email in seen_emails or data.username in seen_usernames:
+            results[line_no] = {"row": line_no, "status": "duplicate", "email": data.email}
+            continue
+        seen_emails.add(data.email)
+        seen_usernames.add(data.username)
+        valid.append((line_no, data))
+
+    async with async_session_factory() as session:
+        if valid:
+            existing = (await session.exec(
+                select(User.email, User.username).where(or_(User.email.in_(seen_emails), User.username.in_(seen_usernames)))
+            )).all()
+            taken_emails = {email for email, _ in existing}
+            taken_usernames = {username for _, username in existing}
+            fresh = []
+            for line_no, data in valid:
+                if data.email in taken_emails or data.username in taken_usernames:
+                    results[line_no] = {"row": line_no, "status": "exists", "email": data.email}
+                else:
+                    fresh.append((line_no, data))
+            valid = fresh
+
+        if valid:
+            hashes = await asyncio.gather(*(_hash(data.password) for _, data in valid))
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "email": data.email,
+                    "username": data.username,
+                    "hashed_password": hashed,
+                    "is_verified": False,
+                    "verification_code": generate_verification_code(),
+                    "created_at": now,
+                }
+                for (_, data), hashed in zip(valid, hashes)
+            ]
+            dialect_insert = _DIALECT_INSERTS.get(session.bind.dialect.name, insert)
+            stmt = dialect_insert(User)
+            if dialect_insert is not insert:
+                # Rows inserted concurrently by /register since the SELECT above are skipped, not failed,
+                # and only rows this statement actually inserted come back.
+                stmt = stmt.on_conflict_do_nothing()
+            created = dict((await session.exec(stmt.returning(User.email, User.id), params=rows)).all())
+            emails = []
+            for (line_no, data), row in zip(valid, rows):
+                if data.email in created:
+                    results[line_no] = {"row": line_no, "status": "created", "id": created[data.email], "email": data.email}
+                    emails.append(verification_email_row(data.email, row["verification_code"], now))
+                else:
+                    results[line_no] = {"row": line_no, "status": "exists", "email": data.email}
+            if emails:
+                await session.exec(insert(OutboxEmail), params=emails)
+            await session.commit()
+            dispatcher.notify()
+
+    return [results[line_no] for line_no in sorted(results)]
+
+
+async def import_users(rows: AsyncIterable[tuple[int, dict | None, str | None]]) -> AsyncIterator[dict]:
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= settings.IMPORT_BATCH_SIZE:
+            for result in await _import_batch(batch):
+                yield result
+            batch = []
+    if batch:
+        for result in await _import_batch(batch):
+            yield result
@@ -0,0 +1,251 @@
+"""Transactional outbox for verification emails.
+
+Rows are written in the same transaction as the change that needs the email;
+OutboxDispatcher drains them in batches over pooled SMTP connections, with
+exponential backoff and dead-lettering after OUTBOX_MAX_ATTEMPTS. It runs as a
+task inside the API process, or standalone with `python -m app.mailer` (set
+OUTBOX_DISPATCHER_ENABLED=false on the web workers then). Claims use a lease,
+so several dispatchers can share one table. Bodies are blanked once a row is
+sent, dead or cancelled, so verification codes do not sit in the table.
+
+With SMTP_HOST unset, messages are printed to the console. For a local SMTP
+stand-in: `python -m aiosmtpd -n -l localhost:8025` with SMTP_HOST=localhost
+and SMTP_PORT=8025.
+"""
+import asyncio
+import logging
+import queue
+import smtplib
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .config import settings
+from .db import async_session_factory
+from .metrics import Counter
+from .models import OutboxEmail
+
+logger = logging.getLogger("app.mailer")
+
+OUTBOX_DELIVERIES = Counter("outbox_deliveries_total", "Outbox delivery attempts by result.", ("result",))
+
+
+def verification_email(recipient: str, code: str) -> OutboxEmail:
+    return OutboxEmail(
+        recipient=recipient,
+        kind="verification",
+        subject="Your verification code",
+        body=f"Your verification code is {code}.\n",
+    )
+
+
+def verification_email_row(recipient: str, code: str, now: datetime) -> dict:
+    # Plain-dict form for executemany inserts (ORM defaults do not apply there).
+    email = verification_email(recipient, code)
+    return {
+        "recipient": email.recipient,
+        "kind": email.kind,
+        "subject": email.subject,
+        "body": email.body,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+
+async def cancel_pending(session: AsyncSession, recipient: str, kind: str):
+    """Supersede queued emails of this kind; runs in the caller's transaction, which commits it."""
+    await session.exec(
+        update(OutboxEmail)
+        .where(OutboxEmail.recipient == recipient, OutboxEmail.kind == kind, OutboxEmail.status.in_(("pending", "sending")))
+        .values(status="cancelled", body="", claim_token=None)
+    )
+
+
+class ConsoleTransport:
+    def send_batch(self, messages: list[OutboxEmail]) -> list[str | None]:
+        for message in messages:
+            print(f"[DEV] Email to {message.recipient}: {message.subject}\n{message.body}")
+        return [None] * len(messages)
+
+    def close(self):
+        pass
+
+
+class SmtpTransport:
+    """Blocking smtplib client with up to SMTP_POOL_SIZE connections kept open between batches."""
+
+    def __init__(self):
+        self._idle: queue.SimpleQueue[smtplib.SMTP] = queue.SimpleQueue()
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        if settings.SMTP_STARTTLS:
+            conn.starttls()
+        if settings.SMTP_USERNAME:
+            conn.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD or "")
+        return conn
+
+    def _acquire(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def send_batch(self, messages: list[OutboxEmail]) -> list[str | None]:
+        errors: list[str | None] = []
+        conn = None
+        for message in messages:
+            email = EmailMessage()
+            email["From"] = settings.SMTP_FROM
+            email["To"] = message.recipient
+            email["Subject"] = message.subject
+            email.set_content(message.body)
+            try:
+                if conn is None:
+                    conn = self._acquire()
+                try:
+                    conn.send_message(email)
+                except smtplib.SMTPServerDisconnected:
+                    # Pooled connections may have been dropped by the server while idle.
+                    conn = self._connect()
+                    conn.send_message(email)
+                errors.append(None)
+            except (smtplib.SMTPException, OSError) as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                if not isinstance(e, smtplib.SMTPRecipientsRefused) and conn is not None:
+                    self._discard(conn)
+                    conn = None
+        if conn is not None:
+            self._idle.put(conn)
+        return errors
+
+    def _discard(self, conn: smtplib.SMTP):
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.quit()
+            except (smtplib.SMTPException, OSError):
+                self._discard(conn)
+
+
+class OutboxDispatcher:
+    def __init__(self, transport=None):
+        self.transport = transport or (SmtpTransport() if settings.SMTP_HOST else ConsoleTransport())
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.transport.close()
+
+    async def run(self):
+        while True:
+            try:
+                drained = await self.dispatch_once()
+            except Exception:
+                logger.exception("outbox dispatch failed")
+                drained = 0
+            if drained < settings.OUTBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim(self) -> list[OutboxEmail]:
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        due = (OutboxEmail.status.in_(("pending", "sending")), OutboxEmail.next_attempt_at <= now)
+        async with async_session_factory() as session:
+            ids = (await session.exec(
+                select(OutboxEmail.id).where(*due).order_by(OutboxEmail.id).limit(settings.OUTBOX_BATCH_SIZE)
+            )).all()
+            if not ids:
+                return []
+            await session.exec(
+                update(OutboxEmail)
+                .where(OutboxEmail.id.in_(ids), *due)
+                .values(status="sending", claim_token=token, next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+            )
+            await session.commit()
+            return list((await session.exec(select(OutboxEmail).where(OutboxEmail.claim_token == token))).all())
+
+    async def dispatch_once(self) -> int:
+        messages = await self._claim()
+        if not messages:
+            return 0
+
+        pool_size = max(1, settings.SMTP_POOL_SIZE)
+        chunks = [messages[i::pool_size] for i in range(pool_size) if messages[i::pool_size]]
+        results = await asyncio.gather(*(asyncio.to_thread(self.transport.send_batch, chunk) for chunk in chunks))
+        errors = {message.id: error for chunk, chunk_errors in zip(chunks, results) for message, error in zip(chunk, chunk_errors)}
+
+        now = datetime.utcnow()
+        async with async_session_factory() as session:
+            for message in messages:
+                error = errors[message.id]
+                attempts = message.attempts + 1
+                if error is None:
+                    values = {"status": "sent", "sent_at": now, "body": "", "last_error": None}
+                    result = "sent"
+                elif attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    values = {"status": "dead", "body": "", "last_error": error}
+                    result = "dead"
+                    logger.error("outbox email %d to %s dead-lettered: %s", message.id, message.recipient, error)
+                else:
+                    backoff = min(settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX_SECONDS)
+                    values = {"status": "pending", "next_attempt_at": now + timedelta(seconds=backoff), "last_error": error}
+                    result = "retry"
+                # Matching on the claim token leaves rows cancelled mid-send (resend_code) cancelled.
+                await session.exec(
+                    update(OutboxEmail)
+                    .where(OutboxEmail.id == message.id, OutboxEmail.claim_token == message.claim_token)
+                    .values(attempts=attempts, claim_token=None, **values)
+                )
+                OUTBOX_DELIVERIES.inc(result)
+            await session.commit()
+        return len(messages)
+
+
+dispatcher = OutboxDispatcher()
+
+
+async def _run_standalone():
+    try:
+        await dispatcher.run()
+    finally:
+        dispatcher.transport.close()
+
+
+if __name__ == "__main__":
+    from .db import create_db_and_tables
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    create_db_and_tables()
+    asyncio.run(_run_standalone())
@@ -1,7 +1,12 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from .config import settings
-from .db import create_db_and_tables
+from .db import async_engine, create_db_and_tables
+from .mailer import dispatcher
+from .metrics import MetricsMiddleware, render as render_metrics, start_snapshot_exporter, stop_snapshot_exporter
+from .security import shutdown_hash_executor
 from .auth import router as auth_router
 
 app = FastAPI(title="Auth API")
@@ -13,9 +18,25 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+async def on_startup():
+    if settings.DB_CREATE_ON_STARTUP:
+        await run_in_threadpool(create_db_and_tables)
+    if settings.OUTBOX_DISPATCHER_ENABLED:
+        dispatcher.start()
+    start_snapshot_exporter()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_snapshot_exporter()
+    await dispatcher.stop()
+    shutdown_hash_executor()
+    await async_engine.dispose()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 app.include_router(auth_router)
@@ -0,0 +1,281 @@
+import asyncio
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Callable, Iterable
+from starlette.datastructures import MutableHeaders
+from .config import settings
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list["_Metric"] = []
+# Per-request accumulator of {phase: (seconds, count)}, rendered as the Server-Timing header.
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+# Set in app.serve workers: every series gets worker="<index>" and snapshots are shared via METRICS_DIR.
+_worker_index: int | None = None
+_worker_label = ""
+_exporter: asyncio.Task | None = None
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if _worker_label:
+        parts.append(_worker_label)
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Exposition lines for every labelled series, without HELP/TYPE."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values]
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from a callback returning {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], dict[tuple, float]], labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in self.callback().items()]
+
+
+class CallbackCounter(Gauge):
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+def set_worker(index: int):
+    global _worker_index, _worker_label
+    _worker_index = index
+    _worker_label = f'worker="{index}"'
+
+
+def _snapshot() -> dict[str, list]:
+    return {metric.name: [metric.documentation, metric.kind, list(metric.samples())] for metric in _registry}
+
+
+def _snapshot_path(index: int) -> str:
+    return os.path.join(settings.METRICS_DIR, f"worker-{index}.json")
+
+
+def _sharing() -> bool:
+    return bool(settings.METRICS_DIR) and _worker_index is not None
+
+
+def write_snapshot():
+    path = _snapshot_path(_worker_index)
+    with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def render() -> str:
+    # Whichever worker answers the scrape reports its own live series plus the
+    # other workers' latest snapshots (at most METRICS_FLUSH_SECONDS old).
+    families = _snapshot()
+    if _sharing():
+        own = _snapshot_path(_worker_index)
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "worker-*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, (documentation, kind, samples) in other.items():
+                families.setdefault(name, [documentation, kind, []])[2].extend(samples)
+
+    lines = []
+    for name, (documentation, kind, samples) in families.items():
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", *samples]
+    return "\n".join(lines) + "\n"
+
+
+async def _export_snapshots():
+    while True:
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+        await asyncio.sleep(settings.METRICS_FLUSH_SECONDS)
+
+
+def start_snapshot_exporter():
+    global _exporter
+    if _sharing() and _exporter is None:
+        _exporter = asyncio.create_task(_export_snapshots())
+
+
+async def stop_snapshot_exporter():
+    global _exporter
+    if _exporter is not None:
+        _exporter.cancel()
+        try:
+            await _exporter
+        except asyncio.CancelledError:
+            pass
+        _exporter = None
+
+
+def record_phase(phase: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        total, count = timings.get(phase, (0.0, 0))
+        timings[phase] = (total + seconds, count + 1)
+
+
+def timed(histogram: Histogram, *labels, phase: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                histogram.observe(elapsed, *labels)
+                record_phase(phase, elapsed)
+
+        return wrapper
+
+    return decorator
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+PASSWORD_HASH_SECONDS = Histogram("password_hash_duration_seconds", "bcrypt work per call, excluding queue wait.", ("op",))
+PASSWORD_HASH_QUEUE_SECONDS = Histogram("password_hash_queue_wait_seconds", "Time a hash waited for a free worker.")
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Hashes refused with 503 because the queue was full.")
+JWT_SECONDS = Histogram("jwt_duration_seconds", "JWT encode/verify per call.", ("op",), buckets=(1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 0.001, 0.005))
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Time spent executing SQL statements.")
+DB_POOL_WAIT_SECONDS = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection.")
+
+# Anything else is labelled OTHER: the method comes straight from the client, so each unknown one would be a new series.
+_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+
+_in_flight = 0
+Gauge("http_requests_in_flight", "Requests currently being handled.", lambda: {(): _in_flight})
+
+
+def _threadpool_stats() -> dict[tuple, float]:
+    try:
+        from anyio.to_thread import current_default_thread_limiter
+
+        stats = current_default_thread_limiter().statistics()
+    except RuntimeError:  # no running event loop
+        return {}
+    return {("busy",): stats.borrowed_tokens, ("waiting",): stats.tasks_waiting, ("limit",): stats.total_tokens}
+
+
+Gauge("threadpool_workers", "Starlette/anyio worker thread usage.", _threadpool_stats, ("state",))
+
+
+def _server_timing(timings: dict, total: float) -> str:
+    parts = [f"app;dur={total * 1000:.3f}"]
+    for phase, (seconds, count) in timings.items():
+        parts.append(f'{phase};dur={seconds * 1000:.3f};desc="{count}x"')
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight
+        # Off by default: per-phase timings (hash ran or not, DB hit or cache) reveal which accounts exist.
+        timings: dict | None = {} if settings.SERVER_TIMING_ENABLED else None
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    MutableHeaders(scope=message).append("Server-Timing", _server_timing(timings, time.perf_counter() - start))
+            await send(message)
+
+        _in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _in_flight -= 1
+            _request_timings.reset(token)
+            route = scope.get("route")
+            method = scope["method"] if scope["method"] in _METHODS else "OTHER"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method, getattr(route, "path", "unmatched"), status)
@@ -12,3 +12,20 @@ class User(SQLModel, table=True):
     verification_code: str | None = Field(default=None, index=True)
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class OutboxEmail(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    recipient: str = Field(index=True)
+    kind: str = Field(default="verification")
+    subject: str
+    body: str  # cleared once the row is sent, dead or cancelled
+
+    status: str = Field(default="pending", index=True)  # pending | sending | sent | dead | cancelled
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)  # lease expiry while sending
+    claim_token: str | None = Field(default=None, index=True)
+    last_error: str | None = Field(default=None)
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: datetime | None = Field(default=None)
@@ -0,0 +1,183 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import NamedTuple
+from fastapi import HTTPException, Request
+from .config import settings
+from .metrics import Counter
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected with 429, by rule.", ("rule",))
+
+
+class RateLimit(NamedTuple):
+    name: str
+    limit: int
+    window_seconds: float
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "RateLimit":
+        # "<attempts>/<seconds>", e.g. "5/60"
+        limit, window = spec.split("/")
+        return cls(name, int(limit), float(window))
+
+
+def _sliding_estimate(previous: float, current: float, now: float, window: float) -> float:
+    # Sliding-window counter: the previous fixed window counts in proportion to its overlap.
+    return previous * (1 - (now % window) / window) + current
+
+
+def _retry_after(previous: float, current: float, limit: int, now: float, window: float) -> float:
+    """Seconds until one more attempt fits, given the counts that caused a rejection."""
+    into_window = now % window
+    if current + 1 <= limit and previous > 0:
+        # Still inside this window: wait until previous * (1 - t / window) + current + 1 <= limit.
+        return max(window * (1 - (limit - current - 1) / previous) - into_window, 0.001)
+    # This window alone is full. After it ends its count becomes the weighted previous window,
+    # so also wait until current * (1 - t / window) + 1 <= limit.
+    carry_over = window * (1 - (limit - 1) / current) if current > 0 else 0.0
+    return window - into_window + max(carry_over, 0.0)
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        """Count one attempt against key; return 0 if allowed, else seconds until retrying can succeed.
+
+        Rejected attempts are not counted, so a client that keeps retrying is let
+        back in at the advertised Retry-After rather than locked out further.
+        """
+
+    @abstractmethod
+    async def undo(self, key: str, window: float):
+        """Take back one attempt that hit() allowed, when a later rule rejects the request."""
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process counters, bounded to max_keys with idle keys evicted first.
+
+    Only touched from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._windows: OrderedDict[str, list] = OrderedDict()  # key -> [window index, current, previous, window]
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        index = int(now // window)
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = [index, 0, 0, window]
+            self._windows[key] = entry
+            self._evict(now)
+        elif entry[0] != index:
+            entry[2] = entry[1] if entry[0] == index - 1 else 0
+            entry[0], entry[1] = index, 0
+        self._windows.move_to_end(key)
+
+        if _sliding_estimate(entry[2], entry[1], now, window) + 1 > limit:
+            return _retry_after(entry[2], entry[1], limit, now, window)
+        entry[1] += 1
+        return 0
+
+    async def undo(self, key: str, window: float):
+        # hit() rolls windows over, so the attempt is always in the entry's current count.
+        entry = self._windows.get(key)
+        if entry is not None and entry[1] > 0:
+            entry[1] -= 1
+
+    def _evict(self, now: float):
+        # Least recently used first; a key untouched for two of its windows no longer affects decisions.
+        while self._windows:
+            oldest_key, (index, _, _, window) = next(iter(self._windows.items()))
+            if len(self._windows) <= self.max_keys and index >= int(now // window) - 1:
+                break
+            del self._windows[oldest_key]
+
+
+class RedisBackend(RateLimitBackend):
+    """Counters shared by every worker through Redis (or any client with the redis.asyncio pipeline API)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        index = int(now // window)
+        current_key = f"rl:{key}:{index}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, math.ceil(window * 2))
+            pipe.get(f"rl:{key}:{index - 1}")
+            current, _, previous = await pipe.execute()
+        previous = float(previous or 0)
+        # INCR already counted this attempt, so compare against the limit inclusively.
+        if _sliding_estimate(previous, current, now, window) > limit:
+            # Rejected attempts do not count, matching MemoryBackend.
+            await self.client.decr(current_key)
+            return _retry_after(previous, current - 1, limit, now, window)
+        return 0
+
+    async def undo(self, key: str, window: float):
+        # If a window boundary passed since hit(), this lands in the new window: one extra
+        # attempt there, and the key still expires.
+        current_key = f"rl:{key}:{int(time.time() // window)}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.decr(current_key)
+            pipe.expire(current_key, math.ceil(window * 2))
+            await pipe.execute()
+
+
+def create_backend() -> RateLimitBackend:
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+        return RedisBackend(Redis.from_url(settings.REDIS_URL))
+    return MemoryBackend(settings.RATE_LIMIT_MAX_KEYS)
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+
+    async def check(self, *rules: tuple[RateLimit, str]):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        counted: list[tuple[str, float]] = []
+        for rule, key in rules:
+            bucket = f"{rule.name}:{key}"
+            retry_after = await self.backend.hit(bucket, rule.limit, rule.window_seconds)
+            if retry_after:
+                # A rejected request counts against none of its rules, not just the one that refused it.
+                for counted_bucket, window in counted:
+                    await self.backend.undo(counted_bucket, window)
+                RATE_LIMITED.inc(rule.name)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many attempts, try again later",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+            counted.append((bucket, rule.window_seconds))
+
+
+def client_ip(request: Request) -> str:
+    if settings.TRUST_PROXY_HEADERS:
+        # Entries to the left of those our own proxies appended are whatever the client sent.
+        forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",") if entry.strip()]
+        if forwarded:
+            return forwarded[-min(max(settings.TRUSTED_PROXY_HOPS, 1), len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+
+LOGIN_PER_IP = RateLimit.parse("login_ip", settings.RATE_LIMIT_LOGIN_PER_IP)
+LOGIN_PER_EMAIL = RateLimit.parse("login_email", settings.RATE_LIMIT_LOGIN_PER_EMAIL)
+LOGIN_GLOBAL = RateLimit.parse("login_global", settings.RATE_LIMIT_LOGIN_GLOBAL)
+VERIFY_PER_IP = RateLimit.parse("verify_ip", settings.RATE_LIMIT_VERIFY_PER_IP)
+VERIFY_PER_EMAIL = RateLimit.parse("verify_email", settings.RATE_LIMIT_VERIFY_PER_EMAIL)
+RESEND_PER_IP = RateLimit.parse("resend_ip", settings.RATE_LIMIT_RESEND_PER_IP)
+RESEND_PER_EMAIL = RateLimit.parse("resend_email", settings.RATE_LIMIT_RESEND_PER_EMAIL)
+
+limiter = RateLimiter(create_backend())
@@ -17,6 +17,10 @@ class VerifyCodeIn(BaseModel):
     code: str = Field(min_length=4, max_length=4)
 
 
+class ResendCodeIn(BaseModel):
+    email: EmailStr
+
+
 class UserOut(BaseModel):
     id: int
     email: EmailStr
@@ -1,11 +1,42 @@
-from passlib.context import CryptContext
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from jose import jwt
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from jose import jwt, JWTError, ExpiredSignatureError
+from .cache import TTLCache
 from .config import settings
+from .metrics import (
+    JWT_SECONDS, PASSWORD_HASH_QUEUE_SECONDS, PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS,
+    CallbackCounter, record_phase, timed,
+)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGO = "HS256"
 
+_hash_executor: Executor | None = None
+_hash_capacity = 0
+_hash_inflight = 0
+
+_hmac_key = hmac.new(settings.JWT_SECRET.encode(), digestmod=hashlib.sha256)
+_token_cache = TTLCache(settings.TOKEN_CACHE_SIZE)
+# Anything outside these (aud, iss, jti, extra header fields...) goes through python-jose.
+_FAST_HEADER_KEYS = {"alg", "typ"}
+_FAST_CLAIM_KEYS = {"sub", "type", "exp", "iat", "nbf"}
+
+CallbackCounter(
+    "token_cache_requests_total", "Verified-token cache lookups.",
+    lambda: {("hit",): _token_cache.hits, ("miss",): _token_cache.misses}, ("result",),
+)
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -15,15 +46,151 @@ def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
 
+def _dummy_verify() -> bool:
+    pwd_context.dummy_verify()
+    return False
+    return False
+
+
+def generate_verification_code() -> str:
+    return f"{random.randint(0, 9999):04d}"  # 4-digit code
+
+
+def _get_hash_executor() -> Executor:
+    global _hash_executor, _hash_capacity
+    if _hash_executor is None:
+        workers = settings.HASH_WORKERS or os.cpu_count() or 1
+        if settings.HASH_POOL == "process":
+            # Spawn, not fork: forking a process that is running an event loop and threads can deadlock the child.
+            _hash_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _hash_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        _hash_capacity = workers + settings.HASH_QUEUE_SIZE
+    return _hash_executor
+
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+
+def _release_hash_slot():
+    global _hash_inflight
+    _hash_inflight -= 1
+
+
+def _call_timed(fn, *args):
+    # time.monotonic is system-wide, so the start stamp is comparable across pool processes.
+    return time.monotonic(), fn(*args)
+
+
+async def _run_hashing(op: str, fn, *args, admit: bool = True):
+    # Admission control: the slot is held until the worker finishes, even if the
+    # request awaiting it is cancelled, so the bound reflects real CPU work.
+    global _hash_inflight
+    executor = _get_hash_executor()
+    if admit and _hash_inflight >= _hash_capacity:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, try again shortly",
+            headers={"Retry-After": str(settings.HASH_RETRY_AFTER_SECONDS)},
+        )
+    loop = asyncio.get_running_loop()
+    _hash_inflight += 1
+    submitted = time.monotonic()
+    try:
+        future = executor.submit(_call_timed, fn, *args)
+    except BaseException:
+        _hash_inflight -= 1
+        raise
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_release_hash_slot))
+    started, result = await asyncio.wrap_future(future)
+    finished = time.monotonic()
+    PASSWORD_HASH_QUEUE_SECONDS.observe(started - submitted)
+    PASSWORD_HASH_SECONDS.observe(finished - started, op)
+    record_phase("hashq", started - submitted)
+    record_phase("hash", finished - started)
+    return result
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing("hash", hash_password, password)
+
+
+async def hash_password_bulk(password: str) -> str:
+    # For bulk imports, which bound their own concurrency and must not fail mid-stream:
+    # never answered with 503, but counted in the pool, so /login and /register still are.
+    return await _run_hashing("import", hash_password, password, admit=False)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run_hashing("verify", verify_password, password, hashed)
+
+
+async def dummy_verify_password_async() -> bool:
+    # Same bcrypt cost as a real verify, for logins against unknown emails.
+    return await _run_hashing("verify", _dummy_verify)
+
+
+@timed(JWT_SECONDS, "encode", phase="jwt")
 def create_access_token(sub: str) -> str:
     exp = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return jwt.encode({"sub": sub, "type": "access", "exp": exp}, settings.JWT_SECRET, algorithm=ALGO)
 
 
+@timed(JWT_SECONDS, "encode", phase="jwt")
 def create_refresh_token(sub: str) -> str:
     exp = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     return jwt.encode({"sub": sub, "type": "refresh", "exp": exp}, settings.JWT_SECRET, algorithm=ALGO)
 
 
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _verify_hs256(token: str) -> dict:
+    """Verify one of our own HS256 tokens without python-jose.
+
+    Unlike jose, a token without a numeric exp is rejected: every token we
+    issue carries one, and exp is what bounds its lifetime in the token cache.
+    Tokens with other headers or claims are handed to jose unchanged.
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        if not isinstance(header, dict) or header.get("alg") != ALGO or not header.keys() <= _FAST_HEADER_KEYS:
+            return jwt.decode(token, settings.JWT_SECRET, algorithms=[ALGO])
+        mac = _hmac_key.copy()
+        mac.update(f"{header_b64}.{payload_b64}".encode("ascii"))
+        if not hmac.compare_digest(mac.digest(), _b64decode(signature_b64)):
+            raise JWTError("Signature verification failed.")
+        payload = json.loads(_b64decode(payload_b64))
+    except (ValueError, UnicodeError) as e:
+        raise JWTError("Malformed token") from e
+
+    if not isinstance(payload, dict) or not payload.keys() <= _FAST_CLAIM_KEYS:
+        return jwt.decode(token, settings.JWT_SECRET, algorithms=[ALGO])
+    now = time.time()
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)):
+        raise JWTError("Invalid expiration claim")
+    if exp <= now:
+        raise ExpiredSignatureError("Signature has expired.")
+    nbf = payload.get("nbf")
+    if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+        raise JWTError("The token is not yet valid (nbf)")
+    return payload
+
+
+@timed(JWT_SECONDS, "decode", phase="jwt")
 def decode_token(token: str) -> dict:
-    return jwt.decode(token, settings.JWT_SECRET, algorithms=[ALGO])
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = _token_cache.get(key)
+    if payload is None:
+        payload = _verify_hs256(token)
+        if isinstance(payload.get("exp"), (int, float)):
+            _token_cache.set(key, payload, payload["exp"])
+    return dict(payload)
@@ -0,0 +1,227 @@
+"""Production server: preforked uvicorn workers sharing one listening socket.
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8000] [--reuse-port]
+
+The parent imports the app, warms passlib/jose/pydantic and creates the schema
+once, then forks workers that inherit all of it. SIGHUP replaces workers one at
+a time (each old worker drains its in-flight requests); SIGTERM/SIGINT drain
+and stop everything. Crashed workers are respawned.
+
+Scrape /metrics through the normal port. Whichever worker answers includes every
+worker's series, labelled worker="<index>", via snapshots in METRICS_DIR (a temp
+dir unless configured) that are at most METRICS_FLUSH_SECONDS old. Sum over the
+worker label for service-wide numbers.
+
+With more than one worker, set RATE_LIMIT_BACKEND=redis: the in-memory limiter
+keeps separate counters per worker, so every limit is multiplied by the worker count.
+"""
+import argparse
+import contextlib
+import importlib.util
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+_boot_started = time.perf_counter()
+
+import uvicorn
+
+from .config import settings
+from . import metrics
+
+logger = logging.getLogger("app.serve")
+
+
+def _preload():
+    from .db import create_db_and_tables, engine
+    from .main import app
+    from .security import pwd_context
+
+    pwd_context.handler().get_backend()  # passlib picks its bcrypt backend lazily otherwise
+    app.openapi()  # builds every route's pydantic schema up front
+    create_db_and_tables()
+    engine.dispose()  # never share pooled connections across fork
+    settings.DB_CREATE_ON_STARTUP = False
+    return app
+
+
+def _bind(host: str, port: int, backlog: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    def __init__(self, app, args, sock: socket.socket | None):
+        self.app = app
+        self.args = args
+        self.sock = sock
+        self.workers: dict[int, int] = {}  # pid -> worker index, kept across respawns
+        self._stopping = False
+        self._reload = False
+
+    def _config(self) -> uvicorn.Config:
+        return uvicorn.Config(
+            self.app,
+            loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+            http="httptools" if importlib.util.find_spec("httptools") else "h11",
+            lifespan="on",
+            access_log=False,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            timeout_keep_alive=self.args.keep_alive,
+        )
+
+    def _run_worker(self, index: int):
+        metrics.set_worker(index)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        sock = self.sock or _bind(self.args.host, self.args.port, self.args.backlog, reuse_port=True)
+        uvicorn.Server(self._config()).run(sockets=[sock])
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._run_worker(index)
+            except BaseException:
+                logger.exception("worker crashed")
+                status = 1
+            finally:
+                os._exit(status)
+        self.workers[pid] = index
+        logger.info("worker %d started as worker %d", pid, index)
+
+    def _reap(self) -> list[int]:
+        """Collect exited workers; returns the indexes that need replacing."""
+        dead = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            index = self.workers.pop(pid, None)
+            if index is not None:
+                dead.append(index)
+                logger.info("worker %d exited with status %d", pid, os.waitstatus_to_exitcode(status))
+        return dead
+
+    def _stop_worker(self, pid: int, timeout: float):
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+            if done:
+                self.workers.pop(pid, None)
+                return
+            time.sleep(0.05)
+        logger.warning("worker %d did not drain in %.0fs, killing it", pid, timeout)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def _rolling_restart(self):
+        for pid, index in list(self.workers.items()):
+            self.spawn(index)
+            self._stop_worker(pid, self.args.graceful_timeout + 5)
+
+    def _on_signal(self, signum, _frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stopping = True
+
+    def run(self):
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(sig, self._on_signal)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                logger.info("rolling restart of %d workers", len(self.workers))
+                self._rolling_restart()
+            for index in self._reap():
+                # Back off if workers die right after boot, instead of fork-looping.
+                time.sleep(1)
+                if not self._stopping:
+                    self.spawn(index)
+            time.sleep(0.2)
+
+        logger.info("shutting down %d workers", len(self.workers))
+        for pid in list(self.workers):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with preforked uvicorn workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.WEB_WORKERS or os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds a worker may spend draining")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--reuse-port", action="store_true", help="one SO_REUSEPORT socket per worker instead of a shared one")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    logger.setLevel(logging.INFO)
+
+    imported = time.perf_counter()
+    app = _preload()
+    preloaded = time.perf_counter()
+    logger.info(
+        "startup: imports %.0f ms, preload and schema %.0f ms",
+        (imported - _boot_started) * 1000, (preloaded - imported) * 1000,
+    )
+
+    if args.workers > 1 and settings.RATE_LIMIT_BACKEND == "memory":
+        logger.warning(
+            "RATE_LIMIT_BACKEND=memory with %d workers: every worker keeps its own counters, so each "
+            "rate limit is effectively %d times higher (e.g. login_email %s allows %d attempts). "
+            "Set RATE_LIMIT_BACKEND=redis to share them.",
+            args.workers, args.workers, settings.RATE_LIMIT_LOGIN_PER_EMAIL,
+            int(settings.RATE_LIMIT_LOGIN_PER_EMAIL.split("/")[0]) * args.workers,
+        )
+
+    owned_metrics_dir = None
+    if settings.METRICS_DIR is None:
+        owned_metrics_dir = settings.METRICS_DIR = tempfile.mkdtemp(prefix="auth-metrics-")
+    else:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        for stale in os.listdir(settings.METRICS_DIR):
+            if stale.startswith("worker-"):
+                os.remove(os.path.join(settings.METRICS_DIR, stale))
+
+    sock = None if args.reuse_port else _bind(args.host, args.port, args.backlog, reuse_port=False)
+    logger.info("listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    try:
+        Supervisor(app, args, sock).run()
+    finally:
+        if owned_metrics_dir:
+            shutil.rmtree(owned_metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Throughput and latency of the auth endpoints.
+
+    python -m benchmarks.load [--transport asgi|uvicorn] [--concurrency 16] [--requests 200]
+                              [--scenarios register,verify,login,me,refresh,mixed]
+                              [--out report.json] [--baseline baseline.json] [--tolerance 0.15]
+
+Drives app.main:app in-process over httpx's ASGI transport, or a local uvicorn
+server over a real socket, against a throwaway SQLite file. Alongside the
+end-to-end numbers it times bcrypt, JWT and DB work in isolation. With
+--baseline, exits 1 if any scenario's p95 or throughput is worse than the
+stored report by more than --tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+SCENARIOS = ("register", "verify", "login", "me", "refresh", "mixed")
+MIXED_WEIGHTS = {"me": 70, "refresh": 15, "login": 10, "register": 5}
+PASSWORD = "benchmark-password"
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def _summary_ms(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 3),
+    }
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, hashed_password: str):
+        self.client = client
+        self.hashed_password = hashed_password
+        self.unverified: list[tuple[str, str]] = []
+        self.accounts: list[dict] = []
+        self._ids = itertools.count()
+        self._run_tag = uuid.uuid4().hex[:8]
+
+    def _identity(self) -> tuple[str, str]:
+        n = next(self._ids)
+        return f"bench-{self._run_tag}-{n}@example.com", f"b{self._run_tag}{n}"
+
+    def seed_users(self, count: int, verified: bool) -> list[str]:
+        # Seeded straight into the DB with one shared hash so setup does not pay bcrypt per user.
+        from sqlmodel import Session
+        from app.db import engine
+        from app.models import User
+
+        users = []
+        for _ in range(count):
+            email, username = self._identity()
+            code = None if verified else f"{random.randint(0, 9999):04d}"
+            users.append(User(email=email, username=username, hashed_password=self.hashed_password, is_verified=verified, verification_code=code))
+        with Session(engine, expire_on_commit=False) as session:
+            session.add_all(users)
+            session.commit()
+        if not verified:
+            self.unverified.extend((user.email, user.verification_code) for user in users)
+        return [user.email for user in users]
+
+    async def seed_accounts(self, count: int):
+        for email in self.seed_users(count, verified=True):
+            r = await self.client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+            r.raise_for_status()
+            self.accounts.append({"email": email, "access": r.json()["access_token"], "refresh": r.cookies.get("refresh_token")})
+
+    async def register(self) -> httpx.Response:
+        email, username = self._identity()
+        return await self.client.post("/api/auth/register", json={"email": email, "username": username, "password": PASSWORD})
+
+    async def verify(self) -> httpx.Response:
+        email, code = self.unverified.pop()
+        return await self.client.post("/api/auth/verify", json={"email": email, "code": code})
+
+    async def login(self) -> httpx.Response:
+        account = random.choice(self.accounts)
+        return await self.client.post("/api/auth/login", json={"email": account["email"], "password": PASSWORD})
+
+    async def me(self) -> httpx.Response:
+        account = random.choice(self.accounts)
+        return await self.client.get("/api/auth/me", params={"authorization": f"Bearer {account['access']}"})
+
+    async def refresh(self) -> httpx.Response:
+        account = random.choice(self.accounts)
+        return await self.client.post("/api/auth/refresh", headers={"Cookie": f"refresh_token={account['refresh']}"})
+
+    async def mixed(self) -> httpx.Response:
+        name = random.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+        return await getattr(self, name)()
+
+
+async def _run_scenario(op, total: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                statuses[(await op()).status_code] += 1
+            except httpx.HTTPError:
+                statuses["transport_error"] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "throughput_rps": round(total / elapsed, 2),
+        **_summary_ms(latencies),
+    }
+
+
+def _time_sync(fn, samples: int) -> dict:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return _summary_ms(timings)
+
+
+async def _time_async(fn, samples: int) -> dict:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return _summary_ms(timings)
+
+
+async def measure_components(workload: Workload, samples: int) -> dict:
+    from sqlmodel import select
+    from app.db import async_session_factory
+    from app.models import User
+    from app.security import _verify_hs256, create_access_token, decode_token, hash_password, verify_password
+
+    email = workload.seed_users(1, verified=True)[0]
+    async with async_session_factory() as session:
+        user_id = (await session.exec(select(User.id).where(User.email == email))).one()
+    token = create_access_token(str(user_id))
+    bcrypt_samples = max(3, samples // 50)
+
+    async def db_get_user():
+        async with async_session_factory() as session:
+            await session.get(User, user_id)
+
+    async def db_user_by_email():
+        async with async_session_factory() as session:
+            (await session.exec(select(User).where(User.email == email))).first()
+
+    return {
+        "bcrypt_hash": _time_sync(lambda: hash_password(PASSWORD), bcrypt_samples),
+        "bcrypt_verify": _time_sync(lambda: verify_password(PASSWORD, workload.hashed_password), bcrypt_samples),
+        "jwt_create": _time_sync(lambda: create_access_token(str(user_id)), samples),
+        "jwt_verify": _time_sync(lambda: _verify_hs256(token), samples),
+        "jwt_verify_cached": _time_sync(lambda: decode_token(token), samples),
+        "db_get_user": await _time_async(db_get_user, samples),
+        "db_user_by_email": await _time_async(db_user_by_email, samples),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _start_uvicorn(env: dict) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                await client.get("/openapi.json")
+                return proc, base_url
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("uvicorn did not start within 30s")
+
+
+async def run(args) -> dict:
+    from app.db import create_db_and_tables
+    from app.main import app
+    from app.security import hash_password
+
+    create_db_and_tables()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    server = None
+    if args.transport == "uvicorn":
+        server, base_url = await _start_uvicorn(dict(os.environ))
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    report = {
+        "meta": {
+            "transport": args.transport,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "scenarios": {},
+    }
+    try:
+        async with app.router.lifespan_context(app):
+            workload = Workload(client, hash_password(PASSWORD))
+            report["components"] = await measure_components(workload, args.component_samples)
+            await workload.seed_accounts(min(args.concurrency, 32))
+            for name in args.scenarios:
+                if name == "verify":
+                    workload.seed_users(args.requests, verified=False)
+                report["scenarios"][name] = await _run_scenario(getattr(workload, name), args.requests, args.concurrency)
+                print(f"{name:<9} {report['scenarios'][name]}", file=sys.stderr)
+    finally:
+        await client.aclose()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    failures = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {previous['p95_ms']}ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            failures.append(f"{name}: {current['throughput_rps']} req/s vs baseline {previous['throughput_rps']} req/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--component-samples", type=int, default=500)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="auth-bench-")
+    # Must be set before app.config is imported; the uvicorn subprocess inherits it too.
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # Every simulated user shares one client IP; measure the endpoints, not the login throttle.
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    try:
+        # The app logs to stdout (e.g. dev email delivery); keep stdout for the report alone.
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        failures = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
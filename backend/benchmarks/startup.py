@@ -0,0 +1,71 @@
+"""Cold-start cost of the API.
+
+    python -m benchmarks.startup [--repeat 5]
+
+Reports how long a fresh interpreter takes to import app.main, and how long
+`python -m app.serve` takes from exec until a single worker answers HTTP.
+Uses a throwaway SQLite file.
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _import_seconds(env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.main"], cwd=BACKEND_DIR, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def _first_response_seconds(env: dict) -> float:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--host", "127.0.0.1", "--port", str(port), "--workers", "1"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < 60:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1).read()
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError("server did not answer within 60s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="auth-startup-")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}"}
+    try:
+        for name, measure in (("import app.main", _import_seconds), ("serve to first response", _first_response_seconds)):
+            samples = [measure(env) for _ in range(args.repeat)]
+            print(f"{name:<24} median {statistics.median(samples) * 1000:8.1f} ms  min {min(samples) * 1000:8.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
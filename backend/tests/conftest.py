@@ -0,0 +1,53 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Settings are read when app.config is first imported, so point it at a scratch DB first.
+_workdir = tempfile.mkdtemp(prefix="auth-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+
+@pytest.fixture
+def db():
+    """Empty tables; returns the sync engine for setup and assertions."""
+    from sqlmodel import SQLModel, Session
+
+    from app.db import create_db_and_tables, engine
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            session.exec(table.delete())
+        session.commit()
+    return engine
+
+
+@pytest.fixture
+def api(db, monkeypatch):
+    """Calls the app in-process through httpx.ASGITransport (no lifespan), one event loop per request."""
+    import httpx
+
+    from app import ratelimit
+    from app.auth import user_cache
+    from app.db import async_engine
+    from app.main import app
+
+    monkeypatch.setattr(ratelimit.limiter, "backend", ratelimit.MemoryBackend(1000))
+    user_cache.clear()
+
+    def request(method: str, url: str, **kwargs) -> httpx.Response:
+        async def send():
+            try:
+                transport = httpx.ASGITransport(app=app, client=("203.0.113.7", 50000))
+                async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=10) as client:
+                    return await asyncio.wait_for(client.request(method, url, **kwargs), timeout=10)
+            finally:
+                # Pooled aiosqlite connections are bound to this loop.
+                await async_engine.dispose()
+
+        return asyncio.run(send())
+
+    return request
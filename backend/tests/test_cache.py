@@ -0,0 +1,126 @@
+import time
+
+import pytest
+from sqlmodel import Session, select
+
+from app import cache
+from app.auth import user_cache
+from app.cache import UserCache, UserSnapshot
+from app.models import User
+
+
+def _snapshot(user_id: int, verified: bool = False) -> UserSnapshot:
+    return UserSnapshot(user_id, f"User{user_id}@Example.com", f"user{user_id}", "hash", verified, None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_put_is_reachable_by_id_and_lowercased_email():
+    users = UserCache(maxsize=10, ttl_seconds=60)
+    users.put(_snapshot(1))
+    assert users.get_by_id(1) == _snapshot(1)
+    assert users.get_by_email("user1@example.com") == _snapshot(1)
+    assert users.get_by_email("USER1@EXAMPLE.COM") == _snapshot(1)
+
+
+def test_entries_expire_after_ttl(clock):
+    users = UserCache(maxsize=10, ttl_seconds=60)
+    users.put(_snapshot(1))
+    clock[0] += 59
+    assert users.get_by_id(1) is not None
+    clock[0] += 2
+    assert users.get_by_id(1) is None
+    assert users.get_by_email("user1@example.com") is None
+
+
+def test_maxsize_counts_users_not_keys():
+    users = UserCache(maxsize=2, ttl_seconds=60)
+    users.put(_snapshot(1))
+    users.put(_snapshot(2))
+    users.put(_snapshot(3))
+    assert users.get_by_id(1) is None
+    assert users.get_by_email("user1@example.com") is None
+    for user_id in (2, 3):
+        assert users.get_by_id(user_id) is not None
+        assert users.get_by_email(f"user{user_id}@example.com") is not None
+
+
+def test_eviction_is_least_recently_used():
+    users = UserCache(maxsize=2, ttl_seconds=60)
+    users.put(_snapshot(1))
+    users.put(_snapshot(2))
+    users.get_by_id(1)
+    users.get_by_email("user1@example.com")
+    users.put(_snapshot(3))
+    assert users.get_by_id(1) is not None
+    assert users.get_by_id(2) is None
+    assert users.get_by_email("user2@example.com") is None
+
+
+def test_counts_hits_and_misses(clock):
+    users = UserCache(maxsize=10, ttl_seconds=60)
+    users.get_by_id(1)
+    users.put(_snapshot(1))
+    users.get_by_id(1)
+    users.get_by_email("user1@example.com")
+    clock[0] += 61
+    users.get_by_id(1)
+    assert (users.hits, users.misses) == (2, 2)
+
+
+def test_zero_size_disables_cache():
+    users = UserCache(maxsize=0, ttl_seconds=60)
+    users.put(_snapshot(1))
+    assert users.get_by_id(1) is None
+
+
+def _register(api, email="ada@example.com", username="ada"):
+    response = api("POST", "/api/auth/register", json={"email": email, "username": username, "password": "correct horse"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _stored(db, email="ada@example.com") -> User:
+    with Session(db) as session:
+        return session.exec(select(User).where(User.email == email)).one()
+
+
+def test_register_writes_through(api, db):
+    created = _register(api, email="Ada@Example.com")
+    snapshot = user_cache.get_by_id(created["id"])
+    assert snapshot == UserSnapshot.from_user(_stored(db))
+    assert user_cache.get_by_email("ada@example.com") == snapshot
+
+
+def test_verify_writes_through_so_me_sees_it(api, db):
+    created = _register(api)
+    code = _stored(db).verification_code
+
+    response = api("POST", "/api/auth/verify", json={"email": "ada@example.com", "code": code})
+    assert response.status_code == 200, response.text
+    snapshot = user_cache.get_by_id(created["id"])
+    assert snapshot.is_verified is True
+    assert snapshot.verification_code is None
+
+    token = api("POST", "/api/auth/login", json={"email": "ada@example.com", "password": "correct horse"}).json()["access_token"]
+    me = api("GET", "/api/auth/me", params={"authorization": f"Bearer {token}"})
+    assert me.json()["is_verified"] is True
+
+
+def test_resend_code_writes_through(api, db):
+    created = _register(api)
+    old_code = _stored(db).verification_code
+
+    for _ in range(3):  # RESEND_PER_EMAIL allows 3; a new code can repeat the old one (1 in 10^4)
+        assert api("POST", "/api/auth/resend-code", json={"email": "ada@example.com"}).status_code == 200
+        if _stored(db).verification_code != old_code:
+            break
+    new_code = _stored(db).verification_code
+    assert new_code != old_code
+    assert user_cache.get_by_id(created["id"]).verification_code == new_code
+    assert user_cache.get_by_email("ada@example.com").verification_code == new_code
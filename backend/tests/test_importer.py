@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.db import async_engine
+from app.importer import aiter_lines, aiter_sync, import_users, iter_rows
+from app.models import OutboxEmail, User
+from app.security import verify_password
+
+NDJSON = "\n".join([
+    json.dumps({"email": "Ada@Example.com", "username": "ada", "password": "password1"}),
+    json.dumps({"email": "ada@example.com", "username": "ada2", "password": "password1"}),
+    "not json",
+    "",
+    json.dumps({"email": "bob@example.com", "username": "bob", "password": "short"}),
+    json.dumps({"email": "cy@example.com", "username": "cyd", "password": "password1"}),
+]) + "\n"
+
+CSV = "email,username,password\r\nada@example.com,ada,password1\r\ndee@example.com,dee,password1\r\n"
+
+
+@pytest.fixture(autouse=True)
+def import_token(monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_TOKEN", "tok")
+    monkeypatch.setattr(settings, "OUTBOX_DISPATCHER_ENABLED", False)
+
+
+def _collect(agen) -> list:
+    async def collect():
+        try:
+            return [item async for item in agen]
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(collect())
+
+
+def _post(api, body: str, content_type: str = "application/x-ndjson", token: str | None = "tok"):
+    headers = {"content-type": content_type}
+    if token is not None:
+        headers["x-import-token"] = token
+    return api("POST", "/api/auth/import", content=body.encode(), headers=headers)
+
+
+def _results(response) -> list[dict]:
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_aiter_lines_splits_across_chunks():
+    async def chunks():
+        for chunk in (b"a\nb", b"c\n", b"", b"d"):
+            yield chunk
+
+    assert _collect(aiter_lines(chunks())) == ["a", "bc", "d"]
+
+
+def test_iter_rows_reports_line_numbers_and_parse_errors():
+    rows = _collect(iter_rows(aiter_sync(NDJSON.splitlines()), "ndjson"))
+    assert [(line_no, error is None) for line_no, _, error in rows] == [(1, True), (2, True), (3, False), (5, True), (6, True)]
+
+
+def test_iter_rows_csv_uses_header():
+    rows = _collect(iter_rows(aiter_sync(CSV.splitlines(keepends=True)), "csv"))
+    assert rows == [
+        (2, {"email": "ada@example.com", "username": "ada", "password": "password1"}, None),
+        (3, {"email": "dee@example.com", "username": "dee", "password": "password1"}, None),
+    ]
+
+
+def test_import_users_batches_and_queues_emails(db, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_BATCH_SIZE", 2)
+    results = _collect(import_users(iter_rows(aiter_sync(NDJSON.splitlines()), "ndjson")))
+
+    assert [(r["row"], r["status"]) for r in results] == [(1, "created"), (2, "duplicate"), (3, "invalid"), (5, "invalid"), (6, "created")]
+    with Session(db) as session:
+        users = {user.email: user for user in session.exec(select(User)).all()}
+        outbox = session.exec(select(OutboxEmail.recipient, OutboxEmail.kind)).all()
+    assert set(users) == {"ada@example.com", "cy@example.com"}
+    assert verify_password("password1", users["ada@example.com"].hashed_password)
+    assert not users["ada@example.com"].is_verified
+    assert sorted(outbox) == [("ada@example.com", "verification"), ("cy@example.com", "verification")]
+
+
+def test_endpoint_streams_ndjson_results(api):
+    results = _results(_post(api, NDJSON))
+    assert [(r["row"], r["status"]) for r in results] == [(1, "created"), (2, "duplicate"), (3, "invalid"), (5, "invalid"), (6, "created")]
+
+    again = _results(_post(api, NDJSON))
+    assert [(r["row"], r["status"]) for r in again] == [(1, "exists"), (2, "duplicate"), (3, "invalid"), (5, "invalid"), (6, "exists")]
+
+
+def test_endpoint_accepts_csv(api):
+    _results(_post(api, NDJSON))
+    results = _results(_post(api, CSV, content_type="text/csv"))
+    assert [(r["row"], r["status"], r["email"]) for r in results] == [(2, "exists", "ada@example.com"), (3, "created", "dee@example.com")]
+
+
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_endpoint_rejects_bad_token(api, db, token):
+    response = _post(api, NDJSON, token=token)
+    assert response.status_code == 403
+    with Session(db) as session:
+        assert session.exec(select(User)).all() == []
+
+
+def test_endpoint_is_off_without_configured_token(api, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_TOKEN", None)
+    assert _post(api, NDJSON, token="").status_code == 403
@@ -0,0 +1,202 @@
+import asyncio
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+from sqlmodel import delete, select
+
+from app.config import settings
+from app.db import async_engine, async_session_factory, create_db_and_tables
+from app.mailer import OutboxDispatcher, SmtpTransport, cancel_pending, verification_email
+from app.models import OutboxEmail
+
+
+class Inbox:
+    """aiosmtpd handler that records messages, or rejects them with a 550 while `reject` is set."""
+
+    def __init__(self):
+        self.messages: list[str] = []
+        self.reject = False
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject:
+            return "550 Mailbox unavailable"
+        self.messages.append(envelope.content.decode())
+        return "250 OK"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(coro):
+    # Each asyncio.run gets a fresh loop, so pooled aiosqlite connections must not outlive it.
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(wrapper())
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    handler = Inbox()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "OUTBOX_BACKOFF_SECONDS", 30)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture(autouse=True)
+def outbox():
+    create_db_and_tables()
+
+    async def clear():
+        async with async_session_factory() as session:
+            await session.exec(delete(OutboxEmail))
+            await session.commit()
+
+    run(clear())
+
+
+async def _enqueue(*emails: OutboxEmail) -> list[int]:
+    async with async_session_factory() as session:
+        session.add_all(emails)
+        await session.commit()
+        return [email.id for email in emails]
+
+
+async def _rows() -> list[OutboxEmail]:
+    async with async_session_factory() as session:
+        return list((await session.exec(select(OutboxEmail).order_by(OutboxEmail.id))).all())
+
+
+async def _make_due():
+    async with async_session_factory() as session:
+        for row in (await session.exec(select(OutboxEmail))).all():
+            row.next_attempt_at = datetime.utcnow()
+            session.add(row)
+        await session.commit()
+
+
+def _dispatch(dispatcher: OutboxDispatcher) -> int:
+    async def once():
+        try:
+            return await dispatcher.dispatch_once()
+        finally:
+            dispatcher.transport.close()
+
+    return run(once())
+
+
+def test_sent_delivers_over_smtp_and_clears_body(inbox):
+    run(_enqueue(verification_email("a@example.com", "123456")))
+
+    assert _dispatch(OutboxDispatcher(SmtpTransport())) == 1
+
+    assert len(inbox.messages) == 1
+    assert "To: a@example.com" in inbox.messages[0]
+    assert "123456" in inbox.messages[0]
+    [row] = run(_rows())
+    assert row.status == "sent"
+    assert row.attempts == 1
+    assert row.sent_at is not None
+    assert row.body == ""
+    assert row.claim_token is None
+
+
+def test_rejected_message_is_retried_with_backoff(inbox):
+    inbox.reject = True
+    run(_enqueue(verification_email("a@example.com", "123456")))
+
+    before = datetime.utcnow()
+    assert _dispatch(OutboxDispatcher(SmtpTransport())) == 1
+
+    [row] = run(_rows())
+    assert row.status == "pending"
+    assert row.attempts == 1
+    assert "550" in row.last_error
+    assert row.body != ""
+    assert before + timedelta(seconds=30) <= row.next_attempt_at <= datetime.utcnow() + timedelta(seconds=30)
+    # Not due yet, so nothing is claimed until the backoff has passed.
+    assert _dispatch(OutboxDispatcher(SmtpTransport())) == 0
+
+    inbox.reject = False
+    run(_make_due())
+    assert _dispatch(OutboxDispatcher(SmtpTransport())) == 1
+    [row] = run(_rows())
+    assert row.status == "sent"
+    assert row.attempts == 2
+    assert row.last_error is None
+    assert len(inbox.messages) == 1
+
+
+def test_dead_letters_after_max_attempts(inbox):
+    inbox.reject = True
+    run(_enqueue(verification_email("a@example.com", "123456")))
+
+    _dispatch(OutboxDispatcher(SmtpTransport()))
+    run(_make_due())
+    _dispatch(OutboxDispatcher(SmtpTransport()))
+
+    [row] = run(_rows())
+    assert row.status == "dead"
+    assert row.attempts == 2
+    assert "550" in row.last_error
+    assert row.body == ""
+    run(_make_due())
+    assert _dispatch(OutboxDispatcher(SmtpTransport())) == 0
+    assert inbox.messages == []
+
+
+def test_cancel_pending_supersedes_older_codes(inbox):
+    async def resend():
+        async with async_session_factory() as session:
+            await cancel_pending(session, "a@example.com", "verification")
+            session.add(verification_email("a@example.com", "222222"))
+            await session.commit()
+
+    run(_enqueue(verification_email("a@example.com", "111111"), verification_email("b@example.com", "333333")))
+    run(resend())
+
+    assert [(row.recipient, row.status) for row in run(_rows())] == [
+        ("a@example.com", "cancelled"),
+        ("b@example.com", "pending"),
+        ("a@example.com", "pending"),
+    ]
+    assert _dispatch(OutboxDispatcher(SmtpTransport())) == 2
+    assert not any("111111" in message for message in inbox.messages)
+    assert any("222222" in message for message in inbox.messages)
+    assert run(_rows())[0].body == ""
+
+
+def test_cancel_while_sending_is_not_revived(inbox):
+    inbox.reject = True
+    run(_enqueue(verification_email("a@example.com", "111111")))
+    dispatcher = OutboxDispatcher(SmtpTransport())
+    claim = dispatcher._claim
+
+    async def claim_then_cancel():
+        # resend_code lands after the batch was claimed but before its result is recorded.
+        messages = await claim()
+        async with async_session_factory() as session:
+            await cancel_pending(session, "a@example.com", "verification")
+            await session.commit()
+        return messages
+
+    dispatcher._claim = claim_then_cancel
+    assert _dispatch(dispatcher) == 1
+
+    [row] = run(_rows())
+    assert row.status == "cancelled"
+    assert row.attempts == 0
+    assert row.body == ""
@@ -0,0 +1,12 @@
+from app.metrics import render
+
+
+def test_request_metrics_bound_the_method_label(api):
+    for i in range(3):
+        assert api(f"X{i}", "/api/auth/login").status_code == 405
+    api("GET", "/metrics")
+
+    lines = [line for line in render().splitlines() if line.startswith("http_request_duration_seconds_count")]
+    assert any('method="OTHER",route="/api/auth/login",status="405"' in line for line in lines)
+    assert any('method="GET",route="/metrics"' in line for line in lines)
+    assert not any('method="X' in line for line in lines)
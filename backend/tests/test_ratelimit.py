@@ -0,0 +1,240 @@
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, Request
+
+from app import ratelimit
+from app.config import settings
+from app.ratelimit import MemoryBackend, RateLimit, RateLimiter, RedisBackend, client_ip
+
+
+class FakeRedis:
+    """In-process stand-in for the part of redis.asyncio that RedisBackend uses (no key expiry)."""
+
+    def __init__(self):
+        self.data: dict[str, int] = {}
+
+    def pipeline(self, transaction: bool = True):
+        return _FakePipeline(self)
+
+    async def decr(self, key: str) -> int:
+        self.data[key] = self.data.get(key, 0) - 1
+        return self.data[key]
+
+
+class _FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.ops: list[tuple] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.ops.clear()
+
+    def incr(self, key: str):
+        self.ops.append(("incr", key))
+
+    def expire(self, key: str, seconds: int):
+        self.ops.append(("expire", key))
+
+    def get(self, key: str):
+        self.ops.append(("get", key))
+
+    def decr(self, key: str):
+        self.ops.append(("decr", key))
+
+    async def execute(self) -> list:
+        results = []
+        for op, key in self.ops:
+            if op in ("incr", "decr"):
+                self.client.data[key] = self.client.data.get(key, 0) + (1 if op == "incr" else -1)
+                results.append(self.client.data[key])
+            elif op == "expire":
+                results.append(True)
+            else:
+                value = self.client.data.get(key)
+                results.append(None if value is None else str(value).encode())
+        return results
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(999_980.0)  # 20s into a 60s window
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    return MemoryBackend(max_keys=1000) if request.param == "memory" else RedisBackend(FakeRedis())
+
+
+def hit(backend, key="k", limit=5, window=60.0) -> float:
+    return asyncio.run(backend.hit(key, limit, window))
+
+
+def test_allows_up_to_limit_then_rejects(backend, clock):
+    assert [hit(backend) for _ in range(5)] == [0] * 5
+    assert hit(backend) > 0
+
+
+def test_keys_are_independent(backend, clock):
+    for _ in range(5):
+        hit(backend, "a")
+    assert hit(backend, "a") > 0
+    assert hit(backend, "b") == 0
+
+
+def test_rejected_attempts_are_not_counted(backend, clock):
+    for _ in range(5):
+        hit(backend)
+    first = hit(backend)
+    for _ in range(10):
+        assert hit(backend) == pytest.approx(first)
+    clock.now += first + 0.01
+    assert hit(backend) == 0
+
+
+def test_retry_after_accounts_for_previous_window_weight(backend, clock):
+    for _ in range(5):
+        hit(backend)
+    retry_after = hit(backend)
+    # 40s to the window boundary, then 12s more for the carried-over count to decay below 5.
+    assert retry_after == pytest.approx(52)
+
+    clock.now = 999_980.0 + 41  # just into the next window: still throttled
+    assert hit(backend) > 0
+    clock.now = 999_980.0 + retry_after - 0.5
+    assert hit(backend) > 0
+    clock.now = 999_980.0 + retry_after + 0.01
+    assert hit(backend) == 0
+
+
+def test_retry_after_within_window_waits_for_previous_to_decay(backend, clock):
+    clock.now = 1_000_010.0  # 50s into the window
+    for _ in range(5):
+        hit(backend)
+    clock.now = 1_000_030.0  # next window, 10s in: previous weighs 5 * 50/60
+    retry_after = hit(backend)
+    assert retry_after > 0
+    clock.now += retry_after + 0.01
+    assert hit(backend) == 0
+
+
+def test_counts_expire_after_two_windows(backend, clock):
+    for _ in range(5):
+        hit(backend)
+    clock.now += 120
+    assert [hit(backend) for _ in range(5)] == [0] * 5
+
+
+def test_memory_backend_is_bounded(clock):
+    backend = MemoryBackend(max_keys=3)
+    for i in range(10):
+        hit(backend, f"k{i}")
+    assert len(backend._windows) == 3
+    assert list(backend._windows) == ["k7", "k8", "k9"]
+
+
+def test_memory_backend_evicts_idle_keys(clock):
+    backend = MemoryBackend(max_keys=1000)
+    hit(backend, "fast", window=1)
+    hit(backend, "slow", window=900)
+    clock.now += 10
+    hit(backend, "new", window=1)
+    # "fast" has been idle for 10 of its 1s windows; "slow" is still inside its window.
+    assert list(backend._windows) == ["slow", "new"]
+
+
+def test_limiter_raises_429_with_retry_after(clock):
+    limiter = RateLimiter(MemoryBackend(max_keys=1000))
+    rule = RateLimit.parse("login_email", "2/60")
+
+    async def attempt():
+        await limiter.check((rule, "a@example.com"))
+
+    asyncio.run(attempt())
+    asyncio.run(attempt())
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(attempt())
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers["Retry-After"] == str(math.ceil(40 + 30))
+
+
+def test_limiter_checks_every_rule(clock):
+    limiter = RateLimiter(MemoryBackend(max_keys=1000))
+    per_ip = RateLimit("ip", 100, 60)
+    per_email = RateLimit("email", 1, 60)
+    asyncio.run(limiter.check((per_ip, "1.2.3.4"), (per_email, "a@example.com")))
+    with pytest.raises(HTTPException):
+        asyncio.run(limiter.check((per_ip, "1.2.3.4"), (per_email, "a@example.com")))
+    asyncio.run(limiter.check((per_ip, "1.2.3.4"), (per_email, "b@example.com")))
+
+
+def test_request_rejected_by_a_later_rule_is_not_counted_by_earlier_ones(backend, clock):
+    limiter = RateLimiter(backend)
+    per_ip = RateLimit("ip", 3, 60)
+    per_email = RateLimit("email", 1, 60)
+
+    def check(email: str):
+        asyncio.run(limiter.check((per_ip, "1.2.3.4"), (per_email, email)))
+
+    check("a@example.com")
+    for _ in range(5):
+        with pytest.raises(HTTPException):
+            check("a@example.com")
+    # Only the one allowed request used the per-IP budget.
+    check("b@example.com")
+    check("c@example.com")
+    with pytest.raises(HTTPException) as exc_info:
+        check("d@example.com")
+    assert exc_info.value.headers["Retry-After"] == "60"  # 40s left in this window, then 20s for its carry-over to decay
+
+
+def test_limiter_can_be_disabled(clock, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    limiter = RateLimiter(MemoryBackend(max_keys=1000))
+    rule = RateLimit("login_email", 1, 60)
+    for _ in range(5):
+        asyncio.run(limiter.check((rule, "a@example.com")))
+
+
+def test_parse():
+    assert RateLimit.parse("x", "5/900") == RateLimit("x", 5, 900.0)
+
+
+def _request(forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": ("10.0.0.2", 1234)})
+
+
+def test_client_ip_ignores_forwarded_header_by_default():
+    assert client_ip(_request("198.51.100.1")) == "10.0.0.2"
+
+
+@pytest.mark.parametrize(
+    ("hops", "forwarded", "expected"),
+    [
+        (1, "203.0.113.9", "203.0.113.9"),
+        (1, "198.51.100.1, 203.0.113.9", "203.0.113.9"),  # leftmost entry is spoofed by the client
+        (2, "198.51.100.1, 203.0.113.9, 10.0.0.1", "203.0.113.9"),
+        (3, "203.0.113.9, 10.0.0.1", "203.0.113.9"),
+        (1, "", "10.0.0.2"),
+    ],
+)
+def test_client_ip_counts_trusted_hops_from_the_right(monkeypatch, hops, forwarded, expected):
+    monkeypatch.setattr(settings, "TRUST_PROXY_HEADERS", True)
+    monkeypatch.setattr(settings, "TRUSTED_PROXY_HOPS", hops)
+    assert client_ip(_request(forwarded)) == expected
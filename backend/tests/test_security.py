@@ -0,0 +1,218 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from jose import ExpiredSignatureError, JWTError, jwt
+
+from app import security
+from app.config import settings
+from app.security import ALGO, _token_cache, _verify_hs256, create_access_token, decode_token
+
+
+def _token(claims: dict, algorithm: str = ALGO, key: str | None = None, headers: dict | None = None) -> str:
+    return jwt.encode(claims, key or settings.JWT_SECRET, algorithm=algorithm, headers=headers)
+
+
+@pytest.fixture(autouse=True)
+def _empty_token_cache():
+    _token_cache.clear()
+    yield
+    _token_cache.clear()
+
+
+def test_accepts_own_access_token():
+    payload = _verify_hs256(create_access_token("42"))
+    assert payload["sub"] == "42"
+    assert payload["type"] == "access"
+
+
+def test_rejects_tampered_signature():
+    header, payload, signature = create_access_token("42").split(".")
+    flipped = ("A" if signature[0] != "A" else "B") + signature[1:]
+    with pytest.raises(JWTError):
+        _verify_hs256(f"{header}.{payload}.{flipped}")
+
+
+def test_rejects_tampered_payload():
+    header, _, signature = create_access_token("42").split(".")
+    forged = base64.urlsafe_b64encode(json.dumps({"sub": "1", "type": "access", "exp": time.time() + 60}).encode()).rstrip(b"=").decode()
+    with pytest.raises(JWTError):
+        _verify_hs256(f"{header}.{forged}.{signature}")
+
+
+def test_rejects_wrong_key():
+    with pytest.raises(JWTError):
+        _verify_hs256(_token({"sub": "42", "exp": time.time() + 60}, key="other-secret"))
+
+
+@pytest.mark.parametrize("algorithm", ["HS384", "HS512"])
+def test_rejects_other_algorithms(algorithm):
+    with pytest.raises(JWTError):
+        _verify_hs256(_token({"sub": "42", "exp": time.time() + 60}, algorithm=algorithm))
+
+
+def test_rejects_alg_none():
+    header = base64.urlsafe_b64encode(b'{"alg":"none","typ":"JWT"}').rstrip(b"=").decode()
+    payload = base64.urlsafe_b64encode(json.dumps({"sub": "42", "exp": time.time() + 60}).encode()).rstrip(b"=").decode()
+    with pytest.raises(JWTError):
+        _verify_hs256(f"{header}.{payload}.")
+
+
+def test_rejects_expired():
+    with pytest.raises(ExpiredSignatureError):
+        _verify_hs256(_token({"sub": "42", "exp": int(time.time()) - 1}))
+
+
+def test_rejects_missing_exp():
+    # python-jose would accept this; our tokens always carry exp.
+    with pytest.raises(JWTError):
+        _verify_hs256(_token({"sub": "42", "type": "access"}))
+
+
+def test_rejects_not_yet_valid():
+    with pytest.raises(JWTError):
+        _verify_hs256(_token({"sub": "42", "exp": time.time() + 60, "nbf": time.time() + 30}))
+
+
+def test_rejects_malformed():
+    with pytest.raises(JWTError):
+        _verify_hs256("not-a-token")
+
+
+def test_extra_claims_fall_back_to_jose(monkeypatch):
+    calls = []
+    real_decode = jwt.decode
+
+    def spy(*args, **kwargs):
+        calls.append(args[0])
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, "decode", spy)
+    token = _token({"sub": "42", "exp": int(time.time()) + 60, "jti": "abc"})
+    assert _verify_hs256(token)["jti"] == "abc"
+    assert calls == [token]
+
+
+def test_extra_header_fields_fall_back_to_jose(monkeypatch):
+    calls = []
+    real_decode = jwt.decode
+    monkeypatch.setattr(security.jwt, "decode", lambda *a, **kw: calls.append(a[0]) or real_decode(*a, **kw))
+    token = _token({"sub": "42", "exp": int(time.time()) + 60}, headers={"kid": "k1"})
+    assert _verify_hs256(token)["sub"] == "42"
+    assert calls == [token]
+
+
+def test_decode_token_serves_repeat_calls_from_cache(monkeypatch):
+    token = create_access_token("42")
+    decode_token(token)
+    monkeypatch.setattr(security, "_verify_hs256", lambda _: pytest.fail("cache miss"))
+    assert decode_token(token)["sub"] == "42"
+
+
+def test_cached_payload_is_not_shared():
+    token = create_access_token("42")
+    decode_token(token)["sub"] = "mutated"
+    assert decode_token(token)["sub"] == "42"
+
+
+def test_cache_entry_expires_at_token_exp(monkeypatch):
+    now = time.time()
+    token = _token({"sub": "42", "type": "access", "exp": int(now) + 5})
+    assert decode_token(token)["sub"] == "42"
+    assert len(_token_cache) == 1
+
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    with pytest.raises(ExpiredSignatureError):
+        decode_token(token)
+    assert len(_token_cache) == 0
+
+
+@pytest.fixture
+def one_hash_slot(monkeypatch):
+    """A one-thread hash pool with no queue, so a single blocked hash fills it."""
+    security.shutdown_hash_executor()
+    monkeypatch.setattr(settings, "HASH_POOL", "thread")
+    monkeypatch.setattr(settings, "HASH_WORKERS", 1)
+    monkeypatch.setattr(settings, "HASH_QUEUE_SIZE", 0)
+    yield
+    security.shutdown_hash_executor()
+
+
+def test_full_hash_pool_answers_503_and_releases_slot(one_hash_slot):
+    gate = threading.Event()
+
+    async def scenario():
+        first = asyncio.create_task(security._run_hashing("hash", gate.wait))
+        await asyncio.sleep(0)
+        rejected = []
+        for _ in range(3):
+            with pytest.raises(HTTPException) as e:
+                await security._run_hashing("hash", str, "x")
+            rejected.append(e.value)
+        gate.set()
+        assert await first is True
+        await asyncio.sleep(0)  # the release is scheduled with call_soon_threadsafe
+        return rejected
+
+    rejected = asyncio.run(scenario())
+    assert [e.status_code for e in rejected] == [503] * 3
+    assert all(e.headers == {"Retry-After": str(settings.HASH_RETRY_AFTER_SECONDS)} for e in rejected)
+    assert security._hash_inflight == 0
+
+
+def test_hash_slot_is_held_until_the_worker_finishes(one_hash_slot):
+    gate = threading.Event()
+
+    async def scenario():
+        task = asyncio.create_task(security._run_hashing("hash", gate.wait))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0)
+        held = security._hash_inflight
+        gate.set()
+        for _ in range(100):
+            if security._hash_inflight == 0:
+                break
+            await asyncio.sleep(0.01)
+        return held
+
+    assert asyncio.run(scenario()) == 1
+    assert security._hash_inflight == 0
+
+
+def test_hash_slot_is_released_when_the_hash_fails(one_hash_slot):
+    async def scenario():
+        with pytest.raises(ValueError):
+            await security._run_hashing("hash", int, "not a number")
+        await asyncio.sleep(0)
+        return await security._run_hashing("hash", int, "7")
+
+    assert asyncio.run(scenario()) == 7
+    assert security._hash_inflight == 0
+
+
+def test_bulk_hashes_are_not_refused_but_fill_the_pool(one_hash_slot):
+    gate = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.create_task(security._run_hashing("hash", gate.wait))
+        bulk = asyncio.create_task(security.hash_password_bulk("pw"))
+        await asyncio.sleep(0)
+        inflight = security._hash_inflight
+        with pytest.raises(HTTPException) as e:
+            await security.verify_password_async("pw", "hash")
+        gate.set()
+        await blocker
+        return inflight, e.value.status_code, await bulk
+
+    inflight, status, hashed = asyncio.run(scenario())
+    assert (inflight, status) == (2, 503)
+    assert security.verify_password("pw", hashed)
+
+
+def test_dummy_verify_rejects(one_hash_slot):
+    assert asyncio.run(security.dummy_verify_password_async()) is False